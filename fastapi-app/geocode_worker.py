@@ -1,9 +1,18 @@
 import os
-import time
+import re
+import signal
+import hashlib
+import asyncio
 import logging
-import requests
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from types import MappingProxyType
+import aiohttp
+import asyncpg
+
+try:
+    # optional: libpostal's address normaliser (needs the libpostal C library)
+    from postal.expand import expand_address
+except ImportError:
+    expand_address = None
 
 # ── CONFIG & LOGGING ────────────────────────────────────────────────────────────
 logging.basicConfig(
@@ -21,8 +30,39 @@ except ValueError:
     SLEEP_SEC = 10
 
 NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+NOMINATIM_INTERVAL = 1.1  # Nominatim rate limit: 1 req/sec, plus some slack
 HEADERS = {"User-Agent": "SpatialDB-Demo/1.0 (university project)"}
-MAX_ATTEMPTS = 3
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=10)
+DNS_CACHE_SEC = 300
+# "No result" answers in geocode_cache are trusted this long, so rows reset
+# after failing are asked about again once OSM has had time to change.
+NEGATIVE_CACHE_DAYS = 7
+MAX_ATTEMPTS = 3  # part of PENDING_INDEX's predicate: see PENDING_PREDICATE
+MAX_QUERIES = 4  # query variants tried per row and attempt
+SCHEMA_LOCK_RETRY_SEC = 1.0  # poll interval while another worker migrates
+BATCH_ROWS = 10  # rows claimed per poll when geocoding through Nominatim only
+# How long a claimed row stays reserved for the worker that claimed it; longer
+# than any single poll, so other workers can't re-claim rows still in flight.
+CLAIM_LEASE_SEC = 900
+
+# ── OPTIONAL BATCH GEOCODER (bulk backfill; Nominatim handles the misses) ──────
+GEOCODIO_URL = "https://api.geocod.io/v1.7/geocode"
+MAPBOX_BATCH_URL = "https://api.mapbox.com/search/geocode/v6/batch"
+BATCH_CHUNK = {"geocodio": 5000, "mapbox": 50}  # addresses per provider request
+BATCH_GEOCODER_ROWS = 5000  # rows claimed per poll when a batch geocoder is set
+BATCH_TIMEOUT = aiohttp.ClientTimeout(total=600)
+# Failed batch requests in a row before the worker falls back to Nominatim
+# only; an auth error (bad or revoked key) falls back at once.
+BATCH_MAX_FAILURES = 3
+
+BATCH_GEOCODER = os.getenv("BATCH_GEOCODER", "").strip().lower() or None
+BATCH_GEOCODER_KEY = os.getenv("BATCH_GEOCODER_KEY")
+if BATCH_GEOCODER and BATCH_GEOCODER not in BATCH_CHUNK:
+    logger.warning("Unknown BATCH_GEOCODER %r; using Nominatim only", BATCH_GEOCODER)
+    BATCH_GEOCODER = None
+elif BATCH_GEOCODER and not BATCH_GEOCODER_KEY:
+    logger.warning("BATCH_GEOCODER_KEY not set; using Nominatim only")
+    BATCH_GEOCODER = None
 
 if not DATABASE_URL:
     logger.critical("DATABASE_URL must be set in environment")
@@ -30,38 +70,170 @@ if not DATABASE_URL:
 
 # ── SCHEMA ENSURANCE ────────────────────────────────────────────────────────────
 # ── ISO 3166-1 alpha-2 lookup for Nominatim countrycodes ────────────────────
-COUNTRY_CODES = {
+_COUNTRY_CODES = {
     "canada": "ca", "united states": "us", "usa": "us", "us": "us",
     "france": "fr", "switzerland": "ch", "austria": "at", "italy": "it",
     "germany": "de", "japan": "jp", "australia": "au", "norway": "no",
     "sweden": "se", "spain": "es", "chile": "cl", "argentina": "ar",
     "new zealand": "nz", "united kingdom": "gb", "uk": "gb",
 }
+# read-only view keyed by stripped, lower-cased country name
+COUNTRY_CODES = MappingProxyType({k.strip().lower(): v for k, v in _COUNTRY_CODES.items()})
+
+# Rows the worker still has to geocode. The claim query inlines this text and
+# PENDING_INDEX was built with it. The index predicate was fixed when migration
+# 3 ran, though, so MAX_ATTEMPTS must not change without a new migration that
+# drops and rebuilds PENDING_INDEX; otherwise the claim stops matching the
+# index and falls back to scanning ski_resorts.
+PENDING_PREDICATE = (
+    f"geom_wgs84 IS NULL AND NOT geocode_failed AND geocode_attempts < {MAX_ATTEMPTS}"
+)
+
+PENDING_INDEX = "idx_ski_pending_geocode"
+
+async def index_is_valid(conn, name):
+    """pg_index.indisvalid for public.`name`, or None if the index doesn't exist."""
+    return await conn.fetchval(
+        "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass($1);", f"public.{name}"
+    )
+
+async def build_pending_index(conn):
+    """
+    Build PENDING_INDEX concurrently. An interrupted CREATE INDEX CONCURRENTLY
+    leaves an INVALID index behind that IF NOT EXISTS would happily skip, so
+    any such leftover is dropped first and the result is checked before the
+    migration is recorded.
+    """
+    if await index_is_valid(conn, PENDING_INDEX) is False:
+        logger.warning("Dropping invalid %s left by an interrupted build.", PENDING_INDEX)
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {PENDING_INDEX};")
+    await conn.execute(f"""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS {PENDING_INDEX}
+            ON ski_resorts (id)
+         WHERE {PENDING_PREDICATE};
+    """)
+    if not await index_is_valid(conn, PENDING_INDEX):
+        raise RuntimeError(f"{PENDING_INDEX} is not valid after build; it is rebuilt on next start")
+
+# Versioned schema migrations: each runs once and is recorded in schema_version,
+# so restarts don't take an ACCESS EXCLUSIVE lock on ski_resorts for a no-op.
+# Entries are (version, sql or coroutine function, in_transaction); CREATE
+# INDEX CONCURRENTLY can't run inside a transaction block.
+MIGRATIONS = (
+    (1, """
+        ALTER TABLE ski_resorts
+          ADD COLUMN IF NOT EXISTS geocode_attempts INTEGER NOT NULL DEFAULT 0,
+          ADD COLUMN IF NOT EXISTS geocode_failed   BOOLEAN NOT NULL DEFAULT FALSE,
+          ADD COLUMN IF NOT EXISTS country          TEXT NOT NULL DEFAULT 'Canada';
+    """, True),
+    (2, """
+        CREATE TABLE IF NOT EXISTS geocode_cache (
+            key    TEXT PRIMARY KEY,
+            lon    DOUBLE PRECISION,
+            lat    DOUBLE PRECISION,
+            hit_at TIMESTAMPTZ DEFAULT now()
+        );
+    """, True),
+    (3, build_pending_index, False),
+    (4, "ANALYZE ski_resorts;", True),
+    (5, """
+        ALTER TABLE ski_resorts
+          ADD COLUMN IF NOT EXISTS claimed_until TIMESTAMPTZ;
+    """, True),
+    (6, """
+        ALTER TABLE ski_resorts
+          ADD COLUMN IF NOT EXISTS batch_tried BOOLEAN NOT NULL DEFAULT FALSE;
+    """, True),
+)
+
+async def ensure_schema(pool):
+    """Apply any MIGRATIONS newer than the recorded schema_version."""
+    async with pool.acquire() as conn:
+        # serialise concurrent worker starts (including creating schema_version
+        # itself: IF NOT EXISTS doesn't stop two sessions racing on pg_type);
+        # a session lock, since not every migration can run inside a transaction.
+        # Polled with try-lock rather than waited on: a session blocked in
+        # pg_advisory_lock() holds a snapshot that CREATE INDEX CONCURRENTLY
+        # has to wait out, which deadlocks against the migrating worker.
+        while not await conn.fetchval("SELECT pg_try_advisory_lock(hashtext('skidb_schema'));"):
+            logger.info("Waiting for another worker's schema migration...")
+            await asyncio.sleep(SCHEMA_LOCK_RETRY_SEC)
+        try:
+            await conn.execute("CREATE TABLE IF NOT EXISTS schema_version (v INTEGER PRIMARY KEY);")
+            current = await conn.fetchval("SELECT COALESCE(MAX(v), 0) FROM schema_version;")
+            for version, sql, in_transaction in MIGRATIONS:
+                if version <= current:
+                    continue
+                if in_transaction:
+                    async with conn.transaction():
+                        await run_migration(conn, sql)
+                        await record_migration(conn, version)
+                else:
+                    await run_migration(conn, sql)
+                    await record_migration(conn, version)
+                logger.info("Applied schema migration %s.", version)
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(hashtext('skidb_schema'));")
+    logger.info("Schema is at version %s.", max(current, MIGRATIONS[-1][0]))
+
+async def run_migration(conn, sql):
+    if callable(sql):
+        await sql(conn)
+    else:
+        await conn.execute(sql)
+
+async def record_migration(conn, version):
+    await conn.execute(
+        "INSERT INTO schema_version (v) VALUES ($1) ON CONFLICT DO NOTHING;", version
+    )
+
+# ── RATE LIMITING ──────────────────────────────────────────────────────────────
+class RateLimiter:
+    """
+    Async pacing limiter: `async with limiter:` admits one caller per
+    `interval` seconds. Waiting callers yield to the event loop instead of
+    blocking it, so DB work for other rows keeps going in the meantime.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = asyncio.Lock()
+        self._next_slot = 0.0
 
-def country_code(country: str) -> str | None:
-    """Return 2-letter ISO code for a country name, or None."""
-    return COUNTRY_CODES.get(country.strip().lower())
-
-def ensure_tracking_columns(conn):
-    """Create geocode_attempts, geocode_failed, and country if they don't exist."""
-    with conn.cursor() as cur:
-        cur.execute("""
-            ALTER TABLE ski_resorts
-              ADD COLUMN IF NOT EXISTS geocode_attempts INTEGER NOT NULL DEFAULT 0,
-              ADD COLUMN IF NOT EXISTS geocode_failed   BOOLEAN NOT NULL DEFAULT FALSE,
-              ADD COLUMN IF NOT EXISTS country          TEXT NOT NULL DEFAULT 'Canada';
-        """)
-    conn.commit()
-    logger.info("Ensured tracking columns exist on ski_resorts.")
+    async def __aenter__(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            delay = self._next_slot - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_slot = loop.time() + self.interval
+
+    async def __aexit__(self, *exc_info):
+        return False
 
 # ── GEOCODE CALL (Nominatim – free, no API key) ────────────────────────────────
-def geocode(query: str, cc: str | None = None):
+def cache_key(query: str, cc: str | None) -> str:
+    return hashlib.sha1(f"{query}|{cc or ''}".encode()).hexdigest()
+
+async def geocode(pool, session, limiter, query: str, cc: str | None = None):
     """
     Geocode using OpenStreetMap Nominatim.
-    Free, no API key required. Rate limit: 1 request/second.
+    Free, no API key required. Rate limit: 1 request/second (enforced by `limiter`).
     cc = optional ISO 3166-1 alpha-2 country code for Nominatim.
+    Answers are kept in geocode_cache, so retries and restarts don't spend a
+    rate-limit slot on a query already asked; "no result" answers only for
+    NEGATIVE_CACHE_DAYS, after which the query is asked again.
     Returns (lon_wgs84, lat_wgs84) or (None, None).
     """
+    key = cache_key(query, cc)
+    cached = await pool.fetchrow("""
+        SELECT lon, lat FROM geocode_cache
+         WHERE key = $1
+           AND (lon IS NOT NULL OR hit_at > now() - make_interval(days => $2));
+    """, key, NEGATIVE_CACHE_DAYS)
+    if cached is not None:
+        return cached["lon"], cached["lat"]
+
     params = {
         "q": query,
         "format": "json",
@@ -70,97 +242,381 @@ def geocode(query: str, cc: str | None = None):
     if cc:
         params["countrycodes"] = cc
     try:
-        resp = requests.get(NOMINATIM_URL, params=params, headers=HEADERS, timeout=10)
-        resp.raise_for_status()
-        results = resp.json()
+        async with limiter:
+            async with session.get(NOMINATIM_URL, params=params, timeout=HTTP_TIMEOUT) as resp:
+                resp.raise_for_status()
+                results = await resp.json()
+        lon = lat = None
         if results:
             lon = float(results[0]["lon"])
             lat = float(results[0]["lat"])
-            return lon, lat
-        logger.warning("No geocode result for '%s'", query)
-    except requests.RequestException as e:
+        else:
+            logger.warning("No geocode result for '%s'", query)
+        await pool.execute("""
+            INSERT INTO geocode_cache (key, lon, lat)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (key) DO UPDATE
+               SET lon = EXCLUDED.lon, lat = EXCLUDED.lat, hit_at = now();
+        """, key, lon, lat)
+        return lon, lat
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         logger.error("HTTP error during geocode(%s): %s", query, e)
     except (ValueError, KeyError) as e:
         logger.error("Error parsing geocode response for '%s': %s", query, e)
     return None, None
 
+# ── BATCH GEOCODE CALL (Geocodio / Mapbox – API key required) ─────────────────
+def batch_address(row) -> str:
+    parts = (row["name"], row["nearest_city"], row["province"], row["country"] or "Canada")
+    return ", ".join(p for p in parts if p)
+
+async def geocodio_chunk(session, rows):
+    """One Geocodio batch call; returns a (lon, lat) or None per row, in order."""
+    async with session.post(
+        GEOCODIO_URL,
+        params={"api_key": BATCH_GEOCODER_KEY},
+        json=[batch_address(row) for row in rows],
+        timeout=BATCH_TIMEOUT,
+    ) as resp:
+        resp.raise_for_status()
+        body = await resp.json()
+    coords = []
+    for item in body["results"]:
+        hits = item["response"].get("results") or []
+        loc = hits[0]["location"] if hits else None
+        coords.append((float(loc["lng"]), float(loc["lat"])) if loc else None)
+    return coords
+
+async def mapbox_chunk(session, rows):
+    """One Mapbox batch call; returns a (lon, lat) or None per row, in order."""
+    queries = []
+    for row in rows:
+        query = {"q": batch_address(row), "limit": 1}
+        cc = COUNTRY_CODES.get((row["country"] or "Canada").strip().lower())
+        if cc:
+            query["country"] = cc
+        queries.append(query)
+    async with session.post(
+        MAPBOX_BATCH_URL,
+        # results are stored in ski_resorts, which Mapbox only permits for
+        # permanent geocoding requests
+        params={"access_token": BATCH_GEOCODER_KEY, "permanent": "true"},
+        json=queries,
+        timeout=BATCH_TIMEOUT,
+    ) as resp:
+        resp.raise_for_status()
+        body = await resp.json()
+    coords = []
+    for fc in body["batch"]:
+        features = fc.get("features") or []
+        lonlat = features[0]["geometry"]["coordinates"] if features else None
+        coords.append((float(lonlat[0]), float(lonlat[1])) if lonlat else None)
+    return coords
+
+batch_failures = 0  # consecutive failed BATCH_GEOCODER requests
+
+def disable_batch_geocoder(reason):
+    """Stop using BATCH_GEOCODER for this run; Nominatim then takes every row."""
+    global BATCH_GEOCODER
+    logger.error("Giving up on %s (%s); using Nominatim only.", BATCH_GEOCODER, reason)
+    BATCH_GEOCODER = None
+
+async def batch_geocode(session, rows):
+    """
+    Geocode one chunk of `rows` (at most BATCH_CHUNK) in a single
+    BATCH_GEOCODER request. Returns a (lon, lat) or (None, None) per row, in
+    order, or None if the request failed, in which case the rows weren't
+    really tried. An auth error, or BATCH_MAX_FAILURES failures in a row,
+    switches the batch geocoder off.
+    """
+    global batch_failures
+    geocode_chunk = geocodio_chunk if BATCH_GEOCODER == "geocodio" else mapbox_chunk
+    coords = None
+    try:
+        coords = await geocode_chunk(session, rows)
+    except aiohttp.ClientResponseError as e:
+        if e.status in (401, 403):
+            disable_batch_geocoder(f"HTTP {e.status}, check BATCH_GEOCODER_KEY")
+            return None
+        logger.error("HTTP error during %s batch geocode of %s rows: %s", BATCH_GEOCODER, len(rows), e)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error("HTTP error during %s batch geocode of %s rows: %s", BATCH_GEOCODER, len(rows), e)
+    except (ValueError, KeyError, TypeError, IndexError) as e:
+        logger.error("Error parsing %s batch response: %s", BATCH_GEOCODER, e)
+    if coords is not None and len(coords) != len(rows):
+        logger.error("%s returned %s results for %s rows; ignoring them.", BATCH_GEOCODER, len(coords), len(rows))
+        coords = None
+
+    if coords is None:
+        batch_failures += 1
+        if batch_failures >= BATCH_MAX_FAILURES:
+            disable_batch_geocoder(f"{batch_failures} failed requests in a row")
+        return None
+    batch_failures = 0
+    return [lonlat or (None, None) for lonlat in coords]
+
 # ── WORKER ─────────────────────────────────────────────────────────────────────
-def update_ski_resorts(conn):
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        # select rows that need geocoding
-        cur.execute("""
-            SELECT id, name, province, nearest_city, country, geocode_attempts
-              FROM ski_resorts
-             WHERE geom_wgs84 IS NULL
-               AND geocode_failed   = FALSE
-               AND geocode_attempts <  %s
-             LIMIT 10;
-        """, (MAX_ATTEMPTS,))
-        rows = cur.fetchall()
-        if not rows:
-            logger.info("No more records to geocode.")
-            return
+# "Big White Ski Resort" → "Big White", "Nakiska Ski Area" → "Nakiska"
+RESORT_SUFFIX_RE = re.compile(r"\s+(?:ski\s+)?(?:resort|area)$", re.IGNORECASE)
+
+def query_key(query: str) -> str:
+    """`query` reduced to lower-cased words, for spotting near-duplicates."""
+    return " ".join(re.findall(r"\w+", query.lower()))
+
+def query_variants(name: str, province: str, city: str, cntry: str) -> list[str]:
+    """
+    Query strings to try for one resort, most likely hit first: the full
+    name, the name without a trailing "Ski Resort"/"Ski Area", a libpostal
+    expansion of the name (when libpostal is installed), then the
+    nearest-city fallback. Near-duplicates are dropped and the list is capped
+    at MAX_QUERIES, since every uncached variant costs a rate-limit slot.
+    """
+    queries = [f"{name}, {province}, {cntry}"]
+    if (short := RESORT_SUFFIX_RE.sub("", name)) != name:
+        queries.append(f"{short}, {province}, {cntry}")
+    if expand_address is not None:
+        # libpostal lower-cases and strips punctuation, so its first expansion
+        # is often just the raw name again: skip any already queued, and
+        # prefer one that differs from the raw name
+        raw  = query_key(f"{name}, {cntry}")
+        seen = {query_key(q) for q in queries}
+        new  = [e for e in expand_address(f"{name}, {cntry}") if query_key(e) not in seen]
+        queries.extend(sorted(new, key=lambda e: query_key(e) == raw)[:1])
+    queries.append(f"{name}, {city}, {cntry}")
+    unique = {}
+    for query in queries:
+        unique.setdefault(query_key(query), query)
+    return list(unique.values())[:MAX_QUERIES]
+
+async def geocode_first(pool, session, limiter, queries, cc=None):
+    """
+    Try `queries` in order and return the first hit, or (None, None).
+    Later queries are queued on the limiter up front, so each takes the very
+    next slot if everything before it misses; once a hit comes back the rest
+    are cancelled while still waiting, before they spend a slot.
+    """
+    first, *rest = queries
+    later = [asyncio.create_task(geocode(pool, session, limiter, q, cc=cc)) for q in rest]
+    try:
+        lon, lat = await geocode(pool, session, limiter, first, cc=cc)
+        for task in later:
+            if lon is not None:
+                break
+            lon, lat = await task
+    finally:
+        for task in later:
+            task.cancel()
+    return lon, lat
 
-        for row in rows:
-            pid      = row["id"]
-            attempts = row["geocode_attempts"] + 1
+async def geocode_row(pool, session, limiter, row):
+    """Geocode one resort row; returns (lon, lat) or (None, None)."""
+    name     = row["name"] or ""
+    province = row["province"] or ""
+    city     = row["nearest_city"] or ""
+    cntry    = row["country"] or "Canada"
+    cc       = COUNTRY_CODES.get(cntry.strip().lower())
+    queries  = query_variants(name, province, city, cntry)
+    return await geocode_first(pool, session, limiter, queries, cc=cc)
 
-            # bump attempt counter
-            cur.execute("""
+async def write_results(pool, done_ids, success_rows, fail_ids, batch=False):
+    """
+    Flush a batch's outcomes as one UPDATE per kind, in a single transaction,
+    and end the claim lease on every row in `done_ids`. Nominatim rows are
+    charged their attempt here, with the failure mark, rather than at claim
+    time: a worker that died mid-batch could otherwise leave a row at
+    MAX_ATTEMPTS that is neither failed nor ever claimed again. Batch
+    provider rows are marked batch_tried instead.
+    """
+    if not done_ids:
+        return
+    async with pool.acquire() as conn, conn.transaction():
+        if success_rows:
+            ids, lons, lats = zip(*success_rows)
+            await conn.execute("""
                 UPDATE ski_resorts
-                   SET geocode_attempts = %s
-                 WHERE id = %s;
-            """, (attempts, pid))
-
-            name     = row.get("name") or ""
-            province = row.get("province") or ""
-            city     = row.get("nearest_city") or ""
-            cntry    = row.get("country") or "Canada"
-            cc       = country_code(cntry)
-            query    = f"{name}, {province}, {cntry}"
-
-            lon, lat = geocode(query, cc=cc)
-            if lon is None:
-                # fallback: try with nearest city
-                query2 = f"{name}, {city}, {cntry}"
-                lon, lat = geocode(query2, cc=cc)
-                time.sleep(1.1)
-
-            if lon is None:
-                if attempts >= MAX_ATTEMPTS:
-                    cur.execute("""
-                        UPDATE ski_resorts
-                           SET geocode_failed = TRUE
-                         WHERE id = %s;
-                    """, (pid,))
-                    logger.warning("Resort %s marked permanently failed after %s attempts.", pid, attempts)
-                continue
-
-            cur.execute("""
+                   SET lon_wgs84  = v.lon,
+                       lat_wgs84  = v.lat,
+                       geom_wgs84 = ST_SetSRID(ST_MakePoint(v.lon, v.lat), 4326)
+                  FROM unnest($1::int[], $2::float8[], $3::float8[]) AS v(id, lon, lat)
+                 WHERE ski_resorts.id = v.id;
+            """, ids, lons, lats)
+        if fail_ids:
+            await conn.execute("""
                 UPDATE ski_resorts
-                   SET lon_wgs84  = %s,
-                       lat_wgs84  = %s,
-                       geom_wgs84 = ST_SetSRID(ST_MakePoint(%s, %s), 4326)
-                 WHERE id = %s;
-            """, (lon, lat, lon, lat, pid))
-            logger.info(
-                "Updated resort %s '%s' with WGS-84 (%.6f, %.6f)",
-                pid, name, lon, lat
-            )
-            time.sleep(1.1)  # Nominatim rate limit: 1 req/sec
-
-        conn.commit()
+                   SET geocode_failed = TRUE
+                 WHERE id = ANY($1::int[]);
+            """, fail_ids)
+        await conn.execute("""
+            UPDATE ski_resorts
+               SET claimed_until    = NULL,
+                   geocode_attempts = geocode_attempts + (NOT $2)::int,
+                   batch_tried      = batch_tried OR $2
+             WHERE id = ANY($1::int[]);
+        """, done_ids, batch)
+
+async def claim_rows(pool, limit, batch=False):
+    # claim rows that need geocoding in one round-trip. SKIP LOCKED keeps
+    # concurrent claims apart, and the lease in claimed_until keeps other
+    # workers off the rows until write_results ends it (or it expires after a
+    # crash). The pending predicate is inlined rather than bound, since a
+    # generic plan for "attempts < $1" could not be matched to PENDING_INDEX.
+    if batch:
+        # the batch provider is asked about each row once
+        which = "AND NOT batch_tried"
+    else:
+        # with a batch provider set, Nominatim only takes the rows it missed
+        which = "AND batch_tried" if BATCH_GEOCODER else ""
+    return await pool.fetch(f"""
+        UPDATE ski_resorts
+           SET claimed_until = now() + make_interval(secs => $2)
+         WHERE id IN (
+                SELECT id
+                  FROM ski_resorts
+                 WHERE {PENDING_PREDICATE}
+                   AND (claimed_until IS NULL OR claimed_until < now())
+                   {which}
+                 ORDER BY id
+                 LIMIT $1
+                   FOR UPDATE SKIP LOCKED
+               )
+        RETURNING id, name, province, nearest_city, country, geocode_attempts;
+    """, limit, CLAIM_LEASE_SEC)
+
+async def release_rows(pool, ids):
+    """Hand claimed rows back unprocessed by ending their lease."""
+    if not ids:
+        return
+    await pool.execute("""
+        UPDATE ski_resorts
+           SET claimed_until = NULL
+         WHERE id = ANY($1::int[]);
+    """, ids)
+
+async def record_results(pool, rows, coords, batch=False):
+    """Write back `coords` (a (lon, lat) or (None, None) per row, in order)."""
+    success_rows, fail_ids = [], []
+    for row, (lon, lat) in zip(rows, coords):
+        pid      = row["id"]
+        attempts = row["geocode_attempts"] + 1  # counting this one
+
+        if lon is None:
+            if not batch and attempts >= MAX_ATTEMPTS:
+                fail_ids.append(pid)
+                logger.warning("Resort %s marked permanently failed after %s attempts.", pid, attempts)
+            continue
+
+        success_rows.append((pid, lon, lat))
+        logger.info(
+            "Updated resort %s '%s' with WGS-84 (%.6f, %.6f)",
+            pid, row["name"], lon, lat
+        )
+
+    await write_results(pool, [row["id"] for row in rows], success_rows, fail_ids, batch=batch)
+
+async def batch_pass(pool, session):
+    """
+    Send up to BATCH_GEOCODER_ROWS untried rows through BATCH_GEOCODER. Each
+    chunk is written back as soon as its response arrives; misses are left
+    for the Nominatim pass. A failed request ends the pass: its chunk and
+    the rest of the claim are handed back untried for the next poll, rather
+    than sending more requests to a provider that is down or throttling.
+    Returns the number of rows claimed.
+    """
+    provider = BATCH_GEOCODER  # batch_geocode may switch it off mid-pass
+    rows = await claim_rows(pool, BATCH_GEOCODER_ROWS, batch=True)
+    size = BATCH_CHUNK[provider]
+    done = resolved = 0
+    try:
+        while done < len(rows):
+            chunk  = rows[done:done + size]
+            coords = await batch_geocode(session, chunk)
+            if coords is None:
+                break
+            await record_results(pool, chunk, coords, batch=True)
+            resolved += sum(lon is not None for lon, _ in coords)
+            done += len(chunk)
+    finally:
+        # also on shutdown, so the rows don't sit out the lease
+        await release_rows(pool, [row["id"] for row in rows[done:]])
+    if done:
+        logger.info("%s resolved %s of %s rows.", provider, resolved, done)
+    return len(rows)
+
+async def update_ski_resorts(pool, session, limiter):
+    batch_claimed = await batch_pass(pool, session) if BATCH_GEOCODER else 0
+
+    # Nominatim gets at most BATCH_ROWS rows per poll however many the batch
+    # provider missed, so a poll stays short (and its writes small)
+    rows = await claim_rows(pool, BATCH_ROWS)
+    if not rows:
+        if not batch_claimed:
+            logger.info("No more records to geocode.")
+        return
+
+    try:
+        # rows share the limiter, so HTTP calls stay serialised at 1 req/s
+        coords = await asyncio.gather(*(geocode_row(pool, session, limiter, row) for row in rows))
+    except asyncio.CancelledError:
+        # shutting down mid-batch: finished lookups are already in
+        # geocode_cache, so give the rows back without spending an attempt
+        await release_rows(pool, [row["id"] for row in rows])
+        raise
+    await record_results(pool, rows, coords)
 
 # ── MAIN ───────────────────────────────────────────────────────────────────────
-if __name__ == "__main__":
-    # one-time schema migration
-    with psycopg2.connect(DATABASE_URL) as conn:
-        ensure_tracking_columns(conn)
+async def until_stopped(coro, stopping, what):
+    """
+    Run `coro` as a task and return its result, cancelling it if `stopping`
+    finishes first; a cancelled run raises CancelledError.
+    """
+    task = asyncio.create_task(coro)
+    await asyncio.wait({task, stopping}, return_when=asyncio.FIRST_COMPLETED)
+    if not task.done():
+        logger.info("Shutdown requested; cancelling the running %s.", what)
+        task.cancel()
+    return await task
+
+async def main():
+    # `docker compose stop` sends SIGTERM (Ctrl-C sends SIGINT); either one
+    # cancels whatever the worker is doing (schema migration, poll or sleep)
+    # and ends it, well inside Docker's grace period, instead of the worker
+    # getting SIGKILLed mid-batch
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    stopping = asyncio.create_task(stop.wait())
 
-    while True:
+    async with asyncpg.create_pool(DATABASE_URL, min_size=1, max_size=4) as pool:
         try:
-            with psycopg2.connect(DATABASE_URL) as conn:
-                update_ski_resorts(conn)
-        except Exception as e:
-            logger.exception("Worker loop encountered fatal error: %s", e)
-        time.sleep(SLEEP_SEC)
\ No newline at end of file
+            # one-time schema migration; may wait on another worker's lock or
+            # a long index build, so it is cancellable too
+            await until_stopped(ensure_schema(pool), stopping, "schema migration")
+        except asyncio.CancelledError:
+            logger.info("Geocode worker stopped.")
+            return
+
+        limiter   = RateLimiter(NOMINATIM_INTERVAL)
+        # one pooled Nominatim connection, reused between the calls of a poll
+        # (keepalive_timeout only bounds how long our side holds an idle
+        # socket; the server may close it first, and then aiohttp reconnects),
+        # plus a DNS cache so reconnects skip the lookup
+        connector = aiohttp.TCPConnector(
+            limit=1,
+            keepalive_timeout=max(60, SLEEP_SEC * 2),
+            ttl_dns_cache=DNS_CACHE_SEC,
+        )
+        async with aiohttp.ClientSession(headers=HEADERS, connector=connector) as session:
+            while not stop.is_set():
+                try:
+                    await until_stopped(update_ski_resorts(pool, session, limiter), stopping, "batch")
+                except asyncio.CancelledError:
+                    break
+                except Exception as e:
+                    logger.exception("Worker loop encountered fatal error: %s", e)
+                # sleep until the next poll, but wake immediately on shutdown
+                await asyncio.wait({stopping}, timeout=SLEEP_SEC)
+    logger.info("Geocode worker stopped.")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,21 +3,57 @@ FastAPI backend – serves GeoJSON for the Cesium 3D globe frontend.
 Table: ski_resorts (Canadian ski resorts with PostGIS geometry)
 """
 
-import json
 import os
 import re
-
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from fastapi import FastAPI
+from itertools import chain
+from threading import Lock
+from time import monotonic
+
+from cachetools import TTLCache, cached
+from cachetools.func import ttl_cache
+from psycopg import errors
+from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL must be set")
 
-app = FastAPI(title="SkiSpatialDB API")
+# Sync endpoints run on Starlette's threadpool (40 threads by default), so the
+# pool is sized to match and requests never queue on a connection.
+POOL_MIN_CONN = 2
+POOL_MAX_CONN = 40
+
+# Queries are prepared server-side from their second execution on each
+# connection, so the hot SELECTs skip parse + plan after warm-up. Server-side
+# prepared statements need a session-pinned backend: behind PgBouncer use
+# session pooling, or set this to None for transaction pooling.
+PREPARE_THRESHOLD = 1
+
+pool: ConnectionPool | None = None
+
+# The layers only change when the geocoder lands a row (~1/s at best), so
+# serialised FeatureCollections are served from memory for GEOJSON_TTL seconds
+# and browsers and the caching proxy are told they may reuse them for what is
+# left of that (and serve them stale while revalidating).
+GEOJSON_TTL = 30
+geojson_cache = TTLCache(maxsize=4, ttl=GEOJSON_TTL)
+geojson_cache_lock = Lock()
+
+# Arbitrary layers can be far larger than ski_resorts, so they are streamed
+# from a server-side cursor this many features at a time instead of being
+# materialised (or cached) whole.
+STREAM_BATCH = 1000
+
+# Layer names are interpolated into SQL, so only plain identifiers pass.
+TABLE_RE = re.compile(r"\A[a-zA-Z_][a-zA-Z0-9_]*\Z")
+# How long a table's geom_wgs84 lookup is trusted before DDL is re-checked.
+TABLE_CHECK_TTL = 60
+
+app = FastAPI(title="SkiSpatialDB API", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,32 +63,111 @@ app.add_middleware(
 )
 
 
+# ── connection pool ──────────────────────────────────────────────────────────
+
+@app.on_event("startup")
+def open_pool():
+    global pool
+    pool = ConnectionPool(
+        DATABASE_URL,
+        min_size=POOL_MIN_CONN, max_size=POOL_MAX_CONN,
+        kwargs={"prepare_threshold": PREPARE_THRESHOLD, "row_factory": dict_row},
+        open=False,
+    )
+    pool.open()
+
+
+@app.on_event("shutdown")
+def close_pool():
+    if pool is not None:
+        pool.close()
+
+
+def db():
+    """Borrow a pooled connection for the duration of one request."""
+    with pool.connection() as conn:
+        yield conn
+
+
 # ── helpers ──────────────────────────────────────────────────────────────────
 
-def get_conn():
-    return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+def feature_collection(cur, source):
+    """
+    Have PostGIS build the whole FeatureCollection for `source` (a table or a
+    subquery, aliased `t`) in one query. ST_AsGeoJSON(record) turns each row
+    into a Feature with geom_wgs84 as its geometry and every other column as
+    a property. The result comes back as JSON text and is passed through
+    untouched: Python never builds, parses or re-encodes a feature.
+    """
+    cur.execute(f"""
+        SELECT json_build_object(
+                   'type',     'FeatureCollection',
+                   'features', COALESCE(json_agg(ST_AsGeoJSON(t.*, 'geom_wgs84')::json), '[]'::json)
+               )::text AS fc
+          FROM {source} t
+         WHERE geom_wgs84 IS NOT NULL;
+    """)
+    return cur.fetchone()["fc"]
+
+
+@ttl_cache(maxsize=128, ttl=TABLE_CHECK_TTL)
+def table_has_geom(table: str) -> bool:
+    """Whether public.`table` exists and has a geom_wgs84 column."""
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT column_name FROM information_schema.columns
+             WHERE table_schema = 'public'
+               AND table_name   = %s
+               AND column_name  = 'geom_wgs84';
+        """, (table,))
+        return cur.fetchone() is not None
+
+
+def geojson_headers(max_age=GEOJSON_TTL):
+    return {
+        "Cache-Control": f"public, max-age={max_age}, stale-while-revalidate={2 * GEOJSON_TTL}",
+        "Vary": "Origin",
+    }
 
 
-def rows_to_geojson(rows, geom_col="geometry"):
-    """Convert DB rows (with a GeoJSON-text geometry column) to a FeatureCollection."""
-    features = []
-    for row in rows:
-        geom_text = row.pop(geom_col, None)
-        geom = json.loads(geom_text) if geom_text else None
-        features.append({
-            "type": "Feature",
-            "geometry": geom,
-            "properties": {k: _serialise(v) for k, v in row.items()},
-        })
-    return {"type": "FeatureCollection", "features": features}
+@cached(geojson_cache, key=lambda key, source: key, lock=geojson_cache_lock)
+def geojson_bytes(key, source):
+    """(build time, serialised FeatureCollection) for `source`, cached under `key`."""
+    with pool.connection() as conn, conn.cursor() as cur:
+        return monotonic(), feature_collection(cur, source).encode()
 
 
-def _serialise(v):
-    """Make values JSON-safe (Decimal → float, etc.)."""
-    from decimal import Decimal
-    if isinstance(v, Decimal):
-        return float(v)
-    return v
+def geojson_response(key, source):
+    built_at, content = geojson_bytes(key, source)
+    # count the entry's time in geojson_cache against max-age, so downstream
+    # caches don't hold bytes up to GEOJSON_TTL old for a further GEOJSON_TTL
+    max_age = GEOJSON_TTL - int(monotonic() - built_at)
+    return Response(
+        content=content,
+        media_type="application/json",
+        headers=geojson_headers(max(max_age, 1)),
+    )
+
+
+def stream_feature_collection(table):
+    """
+    Yield a FeatureCollection for public.`table` chunk by chunk. Each row is
+    already a GeoJSON Feature string from PostGIS, so Python only joins bytes
+    and memory stays bounded by STREAM_BATCH regardless of table size.
+    The query runs, and its first batch is fetched, before the first chunk is
+    yielded, so priming the generator surfaces any query error.
+    """
+    with pool.connection() as conn, conn.cursor(name="geojson_stream") as cur:
+        cur.execute(f"""
+            SELECT ST_AsGeoJSON(t.*, 'geom_wgs84') AS feature
+              FROM public.{table} t
+             WHERE geom_wgs84 IS NOT NULL;
+        """)
+        rows = cur.fetchmany(STREAM_BATCH)
+        yield b'{"type":"FeatureCollection","features":[' + b",".join(r["feature"].encode() for r in rows)
+        while rows := cur.fetchmany(STREAM_BATCH):
+            yield b"," + b",".join(r["feature"].encode() for r in rows)
+        yield b"]}"
 
 
 # ── endpoints ────────────────────────────────────────────────────────────────
@@ -60,16 +175,11 @@ def _serialise(v):
 @app.get("/api/geojson/ski_resorts")
 def ski_resorts_geojson():
     """All ski resorts that have a geometry."""
-    with get_conn() as conn, conn.cursor() as cur:
-        cur.execute("""
-            SELECT id, name, province, nearest_city, country,
-                   vertical_drop_m, num_runs, num_lifts,
-                   ST_AsGeoJSON(geom_wgs84) AS geometry
-              FROM ski_resorts
-             WHERE geom_wgs84 IS NOT NULL;
-        """)
-        rows = cur.fetchall()
-    return JSONResponse(rows_to_geojson(rows))
+    return geojson_response("ski_resorts", """(
+        SELECT id, name, province, nearest_city, country,
+               vertical_drop_m, num_runs, num_lifts, geom_wgs84
+          FROM ski_resorts
+    )""")
 
 
 @app.get("/api/geojson/{table}")
@@ -78,33 +188,29 @@ def generic_geojson(table: str):
     Return GeoJSON for any table/view that has a `geom_wgs84` column.
     Only alphanumeric + underscore names allowed (SQL-injection safe).
     """
-    if not re.fullmatch(r"[a-zA-Z_][a-zA-Z0-9_]*", table):
-        return JSONResponse({"error": "invalid table name"}, status_code=400)
-    with get_conn() as conn, conn.cursor() as cur:
-        cur.execute("""
-            SELECT column_name FROM information_schema.columns
-             WHERE table_schema = 'public'
-               AND table_name   = %s
-               AND column_name  = 'geom_wgs84';
-        """, (table,))
-        if not cur.fetchone():
-            return JSONResponse({"error": f"table '{table}' not found or has no geom_wgs84"}, status_code=404)
-
-        cur.execute(f"""
-            SELECT *, ST_AsGeoJSON(geom_wgs84) AS geometry
-              FROM public.{table}
-             WHERE geom_wgs84 IS NOT NULL;
-        """)
-        rows = cur.fetchall()
-        for r in rows:
-            r.pop("geom_wgs84", None)
-    return JSONResponse(rows_to_geojson(rows))
+    if not TABLE_RE.match(table):
+        return ORJSONResponse({"error": "invalid table name"}, status_code=400)
+    if not table_has_geom(table):
+        return ORJSONResponse({"error": f"table '{table}' not found or has no geom_wgs84"}, status_code=404)
+    # run the query before the response starts: once the 200 and headers are
+    # sent, a failure could only cut the body short
+    body = stream_feature_collection(table)
+    try:
+        head = next(body)
+    except (errors.UndefinedTable, errors.UndefinedColumn):
+        # dropped or altered since table_has_geom last looked
+        return ORJSONResponse({"error": f"table '{table}' not found or has no geom_wgs84"}, status_code=404)
+    return StreamingResponse(
+        chain((head,), body),
+        media_type="application/json",
+        headers=geojson_headers(),
+    )
 
 
 @app.get("/api/tables")
-def list_tables():
+def list_tables(conn=Depends(db)):
     """List tables/views that have a geom_wgs84 column."""
-    with get_conn() as conn, conn.cursor() as cur:
+    with conn.cursor() as cur:
         cur.execute("""
             SELECT table_name
               FROM information_schema.columns
@@ -9,7 +9,7 @@ export default defineConfig({
     port: 3000,
     proxy: {
       '/api': {
-        target: 'http://api:8000',
+        target: 'http://proxy:80',
         changeOrigin: true,
       },
     },